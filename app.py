@@ -1,11 +1,41 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+import click
 import csv
 import os
 import datetime
 import json
 import shutil
 import time # Added for generating unique timestamp
+import heapq
+import bisect
+import threading
+import pickle
+import gzip
+import math
+import collections
+import re
+import mmap
+import contextlib
+import functools
+import abc
+import sqlite3
+
+try:
+    import fcntl # Unix only; serializes data writes and journal access across gunicorn workers
+except ImportError:
+    fcntl = None
+
+try:
+    import orjson # Optional: faster JSON encoding/decoding
+except ImportError:
+    orjson = None
+
+try:
+    import brotli # Optional: enables 'br' response compression
+except ImportError:
+    brotli = None
 
 # Initialize Flask App at the top level
 app = Flask(__name__)
@@ -17,7 +47,8 @@ FIELD_NAMES = ['role', 'username', 'password', 'email', 'firstname', 'lastname',
 
 # --- CORE LISTINGS CONFIGURATION ---
 LISTING_DATA_FILE = 'builder_listings.csv'
-LISTING_FIELD_NAMES = ['builder_username', 'property_name', 'location', 'unit_type', 'listing_price', 'status', 'created_timestamp', 'expiry_date']
+# New columns go at the end: some pages parse this CSV by column position
+LISTING_FIELD_NAMES = ['builder_username', 'property_name', 'location', 'unit_type', 'listing_price', 'status', 'created_timestamp', 'expiry_date', 'latitude', 'longitude']
 
 # --- LIVE PROFILE DETAILS CONFIGURATION ---
 LIVE_LISTING_DETAILS_FILE = 'live_listing_details.csv'
@@ -42,6 +73,98 @@ LOG_FIELD_NAMES = ['log_timestamp', 'action_type', 'user_id', 'details']
 PROFILE_LOG_FILE = 'listing_profile_log.csv'
 PROFILE_LOG_FIELD_NAMES = ['log_timestamp', 'listing_timestamp', 'section', 'field_name', 'old_value', 'new_value', 'editor_username']
 
+# --- EXPIRY SWEEPER CONFIGURATION ---
+EXPIRY_SWEEP_INTERVAL_SECONDS = 300 # Set to 0 to disable the background sweeper
+EXPIRED_LISTING_STATUS = 'Expired'
+EXPIRY_EXEMPT_STATUSES = {'Deleted', 'Sold', EXPIRED_LISTING_STATUS} # Never transitioned by the sweeper
+
+# --- WARM START CONFIGURATION ---
+DATA_SNAPSHOT_ENABLED = True # Persist parsed CSVs so new workers skip the cold parse
+DATA_SNAPSHOT_FILE = '.data_snapshot.pickle'
+DATA_SNAPSHOT_VERSION = 3 # Bump whenever the parsed row shape changes
+DATA_WRITE_LOCK_FILE = '.data_write.lock' # flock'd around every read-modify-write of the data CSVs
+DATA_GENERATIONS_FILE = '.data_generations.json' # path -> write counter, bumped under the data write lock
+
+# --- RESPONSE ENCODING CONFIGURATION ---
+COMPRESSION_ENABLED = True
+COMPRESSION_MIN_BYTES = 1024 # Smaller bodies are sent as-is; the headers would eat the savings
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 5
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/javascript', 'text/html', 'text/css', 'text/javascript', 'text/plain', 'text/csv', 'image/svg+xml'}
+JSON_FAST_SERIALIZER = True # Uses orjson when it is installed
+
+# --- MEDIA CONFIGURATION ---
+MEDIA_DIR = 'media'
+MEDIA_MANIFEST_FILE = 'media_manifest.csv' # One row per file that upload_media saved successfully
+MEDIA_MANIFEST_FIELD_NAMES = ['log_timestamp', 'media_dir', 'filename', 'listing_timestamp', 'editor_username']
+MEDIA_GC_CHECKPOINT_FILE = 'media_gc_checkpoint.json'
+MEDIA_GC_INTERVAL_SECONDS = 900 # Set to 0 to disable the background reconciliation job
+MEDIA_GC_BATCH_SIZE = 50 # Listing directories examined per run
+MEDIA_GC_RETENTION_DAYS = 30 # How long an orphan is reported before it may be removed
+MEDIA_GC_REMOVE = False # Background runs only report orphans unless this is enabled
+
+# --- RATE LIMIT CONFIGURATION ---
+RATE_LIMITS_ENABLED = True
+# endpoint -> (bucket capacity, tokens refilled per second); each client IP and each username gets its own bucket
+RATE_LIMITS = {
+    'unified_login': (10, 10 / 60),
+    'login': (10, 10 / 60),
+    'signup': (5, 5 / 600),
+    'upload_media': (30, 30 / 300),
+}
+RATE_LIMIT_TRUST_FORWARDED_FOR = True # The app runs behind a single routing proxy that appends X-Forwarded-For
+RATE_LIMIT_MAX_KEYS = 100000 # Least recently used buckets are evicted past this many keys
+# SQLite file shared by every worker on the host so the budget does not multiply with the worker
+# count; set to None to keep buckets per process (InMemoryTokenBucketStore)
+RATE_LIMIT_STORE_FILE = 'rate_limit_buckets.sqlite3'
+RATE_LIMIT_PRUNE_EVERY = 1000 # Takes per process between sweeps of refilled and excess buckets
+
+# --- CHANGE FEED CONFIGURATION ---
+CHANGE_FEED_BUFFER_SIZE = 1000 # Events kept for replay to reconnecting clients
+CHANGE_FEED_KEEPALIVE_SECONDS = 15
+CHANGE_FEED_MAX_STREAM_SECONDS = 300 # Streams are closed after this; EventSource reconnects with Last-Event-ID
+CHANGE_FEED_MAX_STREAMS = 8 # Open streams per worker; keep below the gunicorn --threads count so other routes get threads
+CHANGE_FEED_BUSY_RETRY_MS = 10000 # Reconnect delay sent to clients turned away when the stream cap is reached
+
+# --- SEARCH CONFIGURATION ---
+VISIBLE_LISTING_STATUSES = {'Active'} # The only listings consultant pages show; nothing else is indexed
+# field -> weight; a field's tokens count this many times towards term frequency
+SEARCH_FIELD_WEIGHTS = {
+    'property_name': 3, 'apartment_name': 3, 'location': 2, 'unit_type': 2,
+    'flooring': 1, 'description': 1
+}
+SEARCH_STOPWORDS = {'a', 'an', 'and', 'at', 'by', 'for', 'in', 'is', 'of', 'on', 'the', 'to', 'with'}
+SEARCH_PREFIX_EXPANSIONS = 5 # Unknown query terms are matched as prefixes of up to this many indexed terms
+SEARCH_MAX_RESULTS = 100
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# --- WRITE-AHEAD JOURNAL CONFIGURATION ---
+PROFILE_JOURNAL_FILE = 'profile_save_journal.jsonl'
+PROFILE_JOURNAL_COMPACT_BYTES = 1024 * 1024 # Committed entries are dropped once the journal grows past this
+
+# --- GEOSPATIAL CONFIGURATION ---
+LOCATION_GAZETTEER_FILE = 'location_gazetteer.csv' # Offline place name -> coordinates table used by geocode_location
+GEO_GRID_CELL_DEGREES = 0.05 # Roughly 5.5 km of latitude per index cell
+GEO_DEFAULT_RADIUS_KM = 5
+GEO_MAX_RADIUS_KM = 500
+EARTH_RADIUS_KM = 6371.0
+
+# --- DEPLOYMENT ROLE CONFIGURATION ---
+# 'standalone' (default): every worker reads and writes the CSVs directly.
+# 'writer': the one process (e.g. gunicorn -w 1 --threads 16; keep --threads above CHANGE_FEED_MAX_STREAMS) that accepts mutations and publishes replica snapshots.
+# 'reader': read-only workers that serve listing reads from the latest replica snapshot.
+DATA_ROLE = os.environ.get('RELIVE_DATA_ROLE', 'standalone')
+REPLICA_SNAPSHOT_DIR = 'replica_snapshots'
+REPLICA_SNAPSHOT_POINTER = os.path.join(REPLICA_SNAPSHOT_DIR, 'CURRENT') # Holds the file name of the latest version
+REPLICA_SNAPSHOT_KEEP = 3 # Older versions are deleted; readers that still map one keep its pages until they swap
+REPLICA_SNAPSHOT_CHECK_SECONDS = 1.0 # How often readers look for a new version
+REPLICA_PUBLISH_DEBOUNCE_SECONDS = 0.5 # Writes landing within this window share one published version
+MUTATING_ENDPOINTS = {
+    'add_listing', 'update_listing', 'update_profile_data', 'delete_listing', 'upload_media',
+    'add_global_amenity', 'signup', 'update_user', 'change_password'
+}
+
 # --- DEFAULT DATA (Hardcoded defaults for *new* listings) ---
 INITIAL_MOCK_AMENITIES = [
     {'name': "Lift", 'icon': "↑↓"}, {'name': "Internet Provider", 'icon': "🌐"}, {'name': "Club House", 'icon': "🍹"}, 
@@ -76,6 +199,18 @@ def initialize_data_file():
         with open(LISTING_DATA_FILE, 'w', newline='', encoding='utf-8') as f:
             writer = csv.writer(f)
             writer.writerow(LISTING_FIELD_NAMES)
+    else:
+        # Rewrite with the current header if columns were added since the file was created,
+        # geocoding the existing listings on the way since they predate the coordinate columns
+        with data_write_lock():
+            with open(LISTING_DATA_FILE, 'r', newline='', encoding='utf-8') as f:
+                header = next(csv.reader(f), [])
+            if header != LISTING_FIELD_NAMES:
+                listings = load_listings()
+                for listing in listings:
+                    if not _listing_coordinates(listing):
+                        fill_listing_coordinates(listing)
+                update_all_listings(listings)
 
     if not os.path.exists(LIVE_LISTING_DETAILS_FILE):
         with open(LIVE_LISTING_DETAILS_FILE, 'w', newline='', encoding='utf-8') as f:
@@ -100,7 +235,24 @@ def initialize_data_file():
             writer = csv.writer(f)
             writer.writerow(PROFILE_LOG_FIELD_NAMES)
 
-initialize_data_file()
+    # Backfill the manifest from disk the first time so pre-existing uploads are not treated as orphans
+    if not os.path.exists(MEDIA_MANIFEST_FILE):
+        backfill_time = datetime.datetime.now().isoformat()
+        with open(MEDIA_MANIFEST_FILE, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=MEDIA_MANIFEST_FIELD_NAMES)
+            writer.writeheader()
+            if os.path.isdir(MEDIA_DIR):
+                for dir_name in sorted(os.listdir(MEDIA_DIR)):
+                    dir_path = os.path.join(MEDIA_DIR, dir_name)
+                    if not os.path.isdir(dir_path):
+                        continue
+                    for filename in sorted(os.listdir(dir_path)):
+                        writer.writerow({'log_timestamp': backfill_time, 'media_dir': dir_name, 'filename': filename, 'listing_timestamp': '', 'editor_username': ''})
+
+# Per-process setup runs on the first request (see _lazy_startup) rather than at import,
+# so `gunicorn --preload` can fork workers from a master that has only warmed the cache.
+_startup_done = False
+_startup_lock = threading.Lock()
 
 # --- Logging Functions (Unchanged) ---
 def log_action(action_type, user_id, details):
@@ -120,9 +272,8 @@ def log_action(action_type, user_id, details):
         print(f"CRITICAL LOGGING ERROR (Application WILL proceed): {e}")
         return False
 
-def log_profile_change(listing_timestamp, section, field_name, old_value, new_value, editor_username):
-    # ... (Profile logging logic remains the same)
-    log_entry = {
+def profile_log_entry(listing_timestamp, section, field_name, old_value, new_value, editor_username):
+    return {
         'log_timestamp': datetime.datetime.now().isoformat(),
         'listing_timestamp': listing_timestamp,
         'section': section,
@@ -131,18 +282,125 @@ def log_profile_change(listing_timestamp, section, field_name, old_value, new_va
         'new_value': new_value,
         'editor_username': editor_username
     }
+
+def log_profile_change(listing_timestamp, section, field_name, old_value, new_value, editor_username):
+    return append_profile_log_entries([profile_log_entry(listing_timestamp, section, field_name, old_value, new_value, editor_username)])
+
+def append_profile_log_entries(log_entries):
+    # Appends a batch of profile log rows with a single open
     try:
         with open(PROFILE_LOG_FILE, 'a', newline='', encoding='utf-8') as f:
             writer = csv.DictWriter(f, fieldnames=PROFILE_LOG_FIELD_NAMES)
-            writer.writerow(log_entry)
+            writer.writerows(log_entries)
         return True
     except Exception as e:
         print(f"CRITICAL PROFILE LOGGING ERROR: {e}")
         return False
 
+# ----------------------------------------------------------------------
+## Parsed Data Cache and Warm Snapshot
+# ----------------------------------------------------------------------
+
+_data_cache = {} # path -> ((st_mtime_ns, st_size, generation), parsed data)
+
+def _load_data_generations():
+    try:
+        with open(DATA_GENERATIONS_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"Ignoring unreadable data generations file: {e}")
+        return {}
+
+def _file_stamp(path):
+    # mtime and size alone miss a same-size rewrite within one mtime tick, so the stamp also
+    # carries the path's write generation, which every writer bumps (see _invalidate_cached).
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, _load_data_generations().get(path, 0))
+
+def _cached_parse(path, parser):
+    """Returns the parsed contents of path, re-parsing only when its stamp (mtime, size, write generation) changed."""
+    # Stamp before parsing: if the file changes mid-read, the next call sees a new stamp and re-parses.
+    stamp = _file_stamp(path)
+    cached = _data_cache.get(path)
+    if stamp is not None and cached is not None and cached[0] == stamp:
+        return cached[1]
+    data = parser()
+    if stamp is not None:
+        _data_cache[path] = (stamp, data)
+    return data
+
+def _invalidate_cached(path):
+    # Called after every write. Dropping the entry covers this process; bumping the shared
+    # generation makes every other worker's cached stamp for path stale as well.
+    _data_cache.pop(path, None)
+    with data_write_lock():
+        generations = _load_data_generations()
+        generations[path] = generations.get(path, 0) + 1
+        tmp_path = f"{DATA_GENERATIONS_FILE}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(generations, f)
+            os.replace(tmp_path, DATA_GENERATIONS_FILE)
+        except Exception as e:
+            print(f"Error bumping data generation for {path}: {e}")
+
+_data_write_lock = threading.RLock()
+_data_write_lock_depth = 0
+_data_write_lock_file = None
+
+@contextlib.contextmanager
+def data_write_lock():
+    """
+    Serializes load -> modify -> rewrite cycles on the data CSVs across threads and, where
+    fcntl exists, across processes. Re-entrant within a thread.
+    """
+    global _data_write_lock_depth, _data_write_lock_file
+    with _data_write_lock:
+        if _data_write_lock_depth == 0 and fcntl is not None:
+            _data_write_lock_file = open(DATA_WRITE_LOCK_FILE, 'a')
+            fcntl.flock(_data_write_lock_file.fileno(), fcntl.LOCK_EX)
+        _data_write_lock_depth += 1
+        try:
+            if _data_write_lock_depth == 1 and _journal_has_open_entry():
+                # Left by a holder that crashed (or failed to roll back): finish it before anything else writes
+                recover_profile_journal()
+            yield
+        finally:
+            _data_write_lock_depth -= 1
+            if _data_write_lock_depth == 0 and _data_write_lock_file is not None:
+                _data_write_lock_file.close() # Closing releases the flock
+                _data_write_lock_file = None
+
+def with_data_write_lock(view):
+    """Runs a route that rewrites data files while holding data_write_lock."""
+    @functools.wraps(view)
+    def locked_view(*args, **kwargs):
+        with data_write_lock():
+            return view(*args, **kwargs)
+    return locked_view
+
 # --- Core Listing and Live Details Management (Minor Changes) ---
+def _read_replica():
+    """Returns the replica snapshot to read from in 'reader' mode, or None to read the CSVs."""
+    return current_replica_snapshot() if DATA_ROLE == 'reader' else None
+
+def data_source_stamp(path):
+    """Changes whenever the data behind path changes; readers track the snapshot version instead of the file."""
+    replica = _read_replica()
+    if replica is not None:
+        return ('replica', replica.version)
+    return _file_stamp(path)
+
 def load_users():
-    # ... (Unchanged)
+    # Callers may mutate rows, so hand out copies of the cached ones
+    return [dict(user) for user in _cached_parse(DATA_FILE, _parse_users_file)]
+
+def _parse_users_file():
     users = []
     try:
         with open(DATA_FILE, 'r', newline='', encoding='utf-8') as f:
@@ -165,9 +423,15 @@ def save_user(data):
     except Exception as e:
         print(f"Error saving user: {e}")
         return False
+    finally:
+        _invalidate_cached(DATA_FILE)
 
 def load_listings():
-    # ... (Unchanged)
+    replica = _read_replica()
+    listings = replica.listings() if replica is not None else _cached_parse(LISTING_DATA_FILE, _parse_listings_file)
+    return [dict(listing) for listing in listings]
+
+def _parse_listings_file():
     listings = []
     try:
         with open(LISTING_DATA_FILE, 'r', newline='', encoding='utf-8') as f:
@@ -196,21 +460,61 @@ def save_listing(data):
     except Exception as e:
         print(f"Error saving listing: {e}")
         return False
+    finally:
+        _invalidate_cached(LISTING_DATA_FILE)
+
+def _fsync_directory(path):
+    # Makes a rename into the directory durable; not supported (nor needed) on every platform
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def rewrite_csv_file(path, fieldnames, rows):
+    """
+    Replaces a CSV file with header + rows without ever exposing a half-written file:
+    the rows go to a temp file that is fsync'd and then renamed over path.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+    _fsync_directory(path)
 
 def update_all_listings(listings):
     # Rewrites the entire core listings file
     try:
-        with open(LISTING_DATA_FILE, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=LISTING_FIELD_NAMES)
-            writer.writeheader()
-            writer.writerows(listings)
+        rewrite_csv_file(LISTING_DATA_FILE, LISTING_FIELD_NAMES, listings)
         return True
     except Exception as e:
         print(f"Error saving all listings: {e}")
         return False
+    finally:
+        _invalidate_cached(LISTING_DATA_FILE)
 
 def load_live_details():
-    # ... (Unchanged, correctly handles JSON loading)
+    replica = _read_replica()
+    if replica is not None:
+        return replica.live_details()
+    return {timestamp: dict(row) for timestamp, row in _cached_parse(LIVE_LISTING_DETAILS_FILE, _parse_live_details_file).items()}
+
+def _parse_live_details_file():
+    # Correctly handles JSON loading of amenities
     details = {}
     try:
         with open(LIVE_LISTING_DETAILS_FILE, 'r', newline='', encoding='utf-8') as f:
@@ -260,6 +564,8 @@ def save_live_detail(data):
     except Exception as e:
         print(f"Error saving live detail: {e}")
         return False
+    finally:
+        _invalidate_cached(LIVE_LISTING_DETAILS_FILE)
 
 def update_all_live_details(details_dict):
     # Rewrites the entire live details file
@@ -279,14 +585,13 @@ def update_all_live_details(details_dict):
             row = {field: csv_data.get(field, '') for field in LIVE_DETAILS_FIELD_NAMES}
             rows_to_write.append(row)
 
-        with open(LIVE_LISTING_DETAILS_FILE, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=LIVE_DETAILS_FIELD_NAMES)
-            writer.writeheader()
-            writer.writerows(rows_to_write)
+        rewrite_csv_file(LIVE_LISTING_DETAILS_FILE, LIVE_DETAILS_FIELD_NAMES, rows_to_write)
         return True
     except Exception as e:
         print(f"Error saving all live details: {e}")
         return False
+    finally:
+        _invalidate_cached(LIVE_LISTING_DETAILS_FILE)
 
 
 # ----------------------------------------------------------------------
@@ -295,6 +600,12 @@ def update_all_live_details(details_dict):
 
 def load_global_amenities():
     """Loads the master list of all known amenities from the global CSV."""
+    replica = _read_replica()
+    if replica is not None:
+        return replica.global_amenities()
+    return [dict(amenity) for amenity in _cached_parse(GLOBAL_AMENITIES_FILE, _parse_global_amenities_file)]
+
+def _parse_global_amenities_file():
     global_amenities = []
     try:
         # Use DictReader to read data with field names
@@ -317,26 +628,1503 @@ def save_global_amenity(amenity_data):
     if not amenity_data.get('name') or not amenity_data.get('icon'):
         return False
 
-    # Check for duplicates before saving (rudimentary check, case insensitive)
-    current_list = load_global_amenities()
-    if any(a['name'].strip().lower() == amenity_data['name'].strip().lower() for a in current_list):
-        return True # Already exists, consider it a success
+    with data_write_lock():
+        # Check for duplicates before saving (rudimentary check, case insensitive)
+        current_list = load_global_amenities()
+        if any(a['name'].strip().lower() == amenity_data['name'].strip().lower() for a in current_list):
+            return True # Already exists, consider it a success
+
+        try:
+            with open(GLOBAL_AMENITIES_FILE, 'a', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=GLOBAL_AMENITIES_FIELD_NAMES)
+                writer.writerow(amenity_data)
+            return True
+        except Exception as e:
+            print(f"Error saving new global amenity: {e}")
+            return False
+        finally:
+            _invalidate_cached(GLOBAL_AMENITIES_FILE)
+
+# ----------------------------------------------------------------------
+## Read Replica Snapshots
+# ----------------------------------------------------------------------
+
+# File layout: magic | 8-byte little-endian header length | JSON header | record bytes.
+# Each listing and each live-details row is its own compact JSON record; the header maps
+# listing timestamps to (offset, length) so readers decode only the rows a request touches.
+# The file is memory-mapped read-only, so its pages are shared by every reader process.
+REPLICA_SNAPSHOT_MAGIC = b'RLSNAP01'
+
+_replica_snapshot = None
+_replica_snapshot_checked_at = 0.0
+_replica_snapshot_lock = threading.Lock()
+_replica_published_stamps = None
+_replica_publish_lock = threading.Lock()
+_replica_publish_requested = threading.Event()
+_replica_publisher_thread = None
+
+class ReplicaSnapshot:
+    """Immutable, memory-mapped view of one published snapshot version."""
+
+    def __init__(self, path):
+        self.name = os.path.basename(path)
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(REPLICA_SNAPSHOT_MAGIC)] != REPLICA_SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a replica snapshot")
+        header_start = len(REPLICA_SNAPSHOT_MAGIC) + 8
+        header_length = int.from_bytes(self._mm[len(REPLICA_SNAPSHOT_MAGIC):header_start], 'little')
+        header = json.loads(self._mm[header_start:header_start + header_length])
+        self._base = header_start + header_length
+        self.version = header['version']
+        self._listing_positions = header['listings'] # [[created_timestamp, offset, length], ...] in file order
+        self._listing_index = {timestamp: (offset, length) for timestamp, offset, length in self._listing_positions}
+        self._detail_index = {timestamp: (offset, length) for timestamp, offset, length in header['details']}
+        self._amenities_position = header['amenities']
+        self._listings = None
+
+    def _decode(self, position):
+        offset, length = position
+        return json.loads(self._mm[self._base + offset:self._base + offset + length])
+
+    def listings(self):
+        # Core rows are small and scanned by most routes, so they are decoded once per version
+        if self._listings is None:
+            self._listings = [self._decode((offset, length)) for _, offset, length in self._listing_positions]
+        return self._listings
+
+    def listing(self, timestamp):
+        position = self._listing_index.get(timestamp)
+        return self._decode(position) if position else None
+
+    def live_detail(self, timestamp):
+        position = self._detail_index.get(timestamp)
+        return self._decode(position) if position else None
+
+    def live_details(self):
+        return {timestamp: self._decode(position) for timestamp, position in self._detail_index.items()}
+
+    def global_amenities(self):
+        return self._decode(self._amenities_position)
+
+def current_replica_snapshot():
+    """Returns the newest published snapshot, checking the pointer file at most once per interval."""
+    global _replica_snapshot, _replica_snapshot_checked_at
+    now = time.monotonic()
+    if _replica_snapshot is not None and now - _replica_snapshot_checked_at < REPLICA_SNAPSHOT_CHECK_SECONDS:
+        return _replica_snapshot
+    with _replica_snapshot_lock:
+        if _replica_snapshot is not None and now - _replica_snapshot_checked_at < REPLICA_SNAPSHOT_CHECK_SECONDS:
+            return _replica_snapshot
+        _replica_snapshot_checked_at = now
+        try:
+            with open(REPLICA_SNAPSHOT_POINTER, 'r', encoding='utf-8') as f:
+                name = f.read().strip()
+        except FileNotFoundError:
+            return _replica_snapshot
+        if _replica_snapshot is None or _replica_snapshot.name != name:
+            try:
+                # Requests already holding the old snapshot keep using it; its mapping closes once unreferenced
+                _replica_snapshot = ReplicaSnapshot(os.path.join(REPLICA_SNAPSHOT_DIR, name))
+            except Exception as e:
+                print(f"Error opening replica snapshot {name}: {e}")
+        return _replica_snapshot
+
+def _encode_records(keyed_records, body):
+    positions = []
+    for key, record in keyed_records:
+        data = json.dumps(record, separators=(',', ':')).encode('utf-8')
+        positions.append([key, len(body), len(data)])
+        body += data
+    return positions
+
+def publish_replica_snapshot(force=False):
+    """
+    Writes listings, live details and global amenities to a new snapshot version and
+    points readers at it. Skipped when none of the source files changed since the last
+    publish. Returns the new version, or None if nothing was published.
+    """
+    global _replica_published_stamps
+    with _replica_publish_lock:
+        # Read all three files between writes so a version never mixes two saves
+        with data_write_lock():
+            stamps = tuple(_file_stamp(path) for path in (LISTING_DATA_FILE, LIVE_LISTING_DETAILS_FILE, GLOBAL_AMENITIES_FILE))
+            if not force and stamps == _replica_published_stamps:
+                return None
+            listings = load_listings()
+            all_live_details = load_live_details()
+            global_amenities = load_global_amenities()
+
+        body = bytearray()
+        header = {
+            'version': time.time_ns(),
+            'listings': _encode_records(((listing.get('created_timestamp') or '', listing) for listing in listings), body),
+            'details': _encode_records(all_live_details.items(), body),
+        }
+        amenities = json.dumps(global_amenities, separators=(',', ':')).encode('utf-8')
+        header['amenities'] = [len(body), len(amenities)]
+        body += amenities
+        header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+
+        name = f"data-{header['version']}.snap"
+        path = os.path.join(REPLICA_SNAPSHOT_DIR, name)
+        try:
+            os.makedirs(REPLICA_SNAPSHOT_DIR, exist_ok=True)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(REPLICA_SNAPSHOT_MAGIC)
+                f.write(len(header_bytes).to_bytes(8, 'little'))
+                f.write(header_bytes)
+                f.write(body)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + '.tmp', path)
+            with open(REPLICA_SNAPSHOT_POINTER + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(name)
+            os.replace(REPLICA_SNAPSHOT_POINTER + '.tmp', REPLICA_SNAPSHOT_POINTER)
+        except Exception as e:
+            print(f"Error publishing replica snapshot: {e}")
+            return None
+        _replica_published_stamps = stamps
+
+        snapshot_files = sorted(f for f in os.listdir(REPLICA_SNAPSHOT_DIR) if f.startswith('data-') and f.endswith('.snap'))
+        for old_name in snapshot_files[:-REPLICA_SNAPSHOT_KEEP]:
+            try:
+                os.remove(os.path.join(REPLICA_SNAPSHOT_DIR, old_name))
+            except OSError:
+                pass # Still mapped on a platform that forbids deleting open files; retried next publish
+        return header['version']
+
+@app.before_request
+def reject_writes_on_readers():
+    """Read replicas never touch the data files; mutations must be routed to the writer."""
+    if DATA_ROLE == 'reader' and request.endpoint in MUTATING_ENDPOINTS:
+        return jsonify({"success": False, "message": "This server is a read-only replica. Please retry against the primary."}), 503
+    return None
+
+def request_replica_publish():
+    """Asks the background publisher for a new snapshot version; bursts of writes are coalesced."""
+    _replica_publish_requested.set()
+
+def _replica_publisher_loop():
+    while True:
+        _replica_publish_requested.wait()
+        time.sleep(REPLICA_PUBLISH_DEBOUNCE_SECONDS)
+        _replica_publish_requested.clear() # Writes from here on trigger another round
+        try:
+            publish_replica_snapshot()
+        except Exception as e:
+            print(f"Error during replica snapshot publish: {e}")
+
+def start_replica_publisher():
+    """Starts the background snapshot publisher once per process."""
+    global _replica_publisher_thread
+    if _replica_publisher_thread is not None:
+        return
+    _replica_publisher_thread = threading.Thread(target=_replica_publisher_loop, name='replica-publisher', daemon=True)
+    _replica_publisher_thread.start()
+
+@app.after_request
+def publish_after_write(response):
+    # Re-encoding the dataset is left to the publisher thread so it stays off the request path
+    if DATA_ROLE == 'writer' and request.endpoint in MUTATING_ENDPOINTS and response.status_code < 400:
+        request_replica_publish()
+    return response
 
+# ----------------------------------------------------------------------
+## Profile Save Journal (Write-Ahead Log)
+# ----------------------------------------------------------------------
+
+# A profile save touches three files. Before any of them is written, the fields it
+# changes are appended to the journal and fsync'd; a 'commit' record follows once both
+# data CSVs are durable, or an 'abort' record once a failed save has been rolled back.
+# Saves resolve their entry before releasing data_write_lock, so an open entry means the
+# holder crashed; it is rolled forward at startup and by the next data_write_lock holder,
+# before any other write can land on top of it.
+_journal_lock = threading.Lock()
+
+def _lock_journal(f):
+    # Released automatically when the file is closed
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+def _fsync_paths(paths):
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            print(f"Warning: could not fsync {path}: {e}")
+
+def _append_journal_record(record, sync):
+    line = json.dumps(record) + '\n'
+    with _journal_lock:
+        with open(PROFILE_JOURNAL_FILE, 'a', encoding='utf-8') as f:
+            _lock_journal(f)
+            f.write(line)
+            f.flush()
+            if sync:
+                os.fsync(f.fileno())
+
+def _outstanding_journal_entries(f):
+    """
+    Returns [(entry, state)] in journal order for the saves that still need work. State
+    'replay': the listing's latest save, with neither a commit nor an abort record (an
+    earlier open save was followed by one that read the files afterwards and wrote its
+    own state, so replaying it would overwrite that). State 'unlogged': committed, but its
+    profile log rows could not be appended. Torn lines are skipped.
+    """
+    saves = []
+    latest = {}
+    resolved = set()
+    unlogged = set()
+    for line in f:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue # Partial write from a crash mid-append: that save never touched the data files
+        if record.get('type') == 'profile_save':
+            saves.append(record)
+            latest[record['listing_timestamp']] = record['id']
+        elif record.get('type') in ('commit', 'abort'):
+            resolved.add(record.get('id'))
+            if record.get('logged') is False:
+                unlogged.add(record.get('id'))
+    outstanding = []
+    for entry in saves:
+        if entry['id'] in unlogged:
+            outstanding.append((entry, 'unlogged'))
+        elif entry['id'] not in resolved and latest[entry['listing_timestamp']] == entry['id']:
+            outstanding.append((entry, 'replay'))
+    return outstanding
+
+def _journal_has_open_entry():
+    """
+    Cheap check of the journal's last record. Every save appends its commit or abort before
+    releasing data_write_lock, so anything else at the tail (a save, a torn line, an
+    unlogged commit) means there is work for recover_profile_journal.
+    """
     try:
-        with open(GLOBAL_AMENITIES_FILE, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=GLOBAL_AMENITIES_FIELD_NAMES)
-            writer.writerow(amenity_data)
+        with open(PROFILE_JOURNAL_FILE, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size == 0:
+                return False
+            f.seek(max(0, size - 65536))
+            tail = f.read()
+    except FileNotFoundError:
+        return False
+    if not tail.endswith(b'\n'):
+        return True
+    try:
+        record = json.loads(tail.rstrip(b'\n').rsplit(b'\n', 1)[-1])
+    except ValueError:
+        return True # Longer than the tail read, or torn: let the full scan decide
+    return record.get('type') != 'abort' and not (record.get('type') == 'commit' and record.get('logged') is not False)
+
+def journal_profile_save(listing_timestamp, core_changes, live_changes, live_details, profile_log_entries):
+    """
+    Durably records an upcoming profile save: the changed core and live fields, plus the
+    complete live details row for listings that have none yet. Returns the entry id, or
+    None if it could not be written.
+    """
+    entry_id = f"{datetime.datetime.now().isoformat()}-{os.getpid()}-{threading.get_ident()}"
+    record = {
+        'type': 'profile_save',
+        'id': entry_id,
+        'listing_timestamp': listing_timestamp,
+        'core_changes': core_changes,
+        'live_changes': live_changes,
+        'live_details': live_details,
+        'profile_log': profile_log_entries
+    }
+    try:
+        _append_journal_record(record, sync=True)
+        return entry_id
+    except Exception as e:
+        print(f"Error writing profile save journal: {e}")
+        return None
+
+def commit_profile_save(entry_id, logged):
+    """
+    Marks a journaled save as complete once both data CSVs are durable (rewrite_csv_file
+    fsyncs them). logged=False keeps its profile log rows in the journal until recovery
+    appends them; the data itself is never replayed after a commit.
+    """
+    if logged:
+        _fsync_paths([PROFILE_LOG_FILE])
+    try:
+        _append_journal_record({'type': 'commit', 'id': entry_id, 'logged': logged}, sync=True)
+    except Exception as e:
+        # The entry stays open, so the next lock holder replays it: same fields, same values
+        print(f"Error committing profile save journal entry: {e}")
+    _compact_profile_journal()
+
+def abort_profile_save(entry_id):
+    """Marks a journaled save as abandoned once its partial writes have been rolled back, so it is never replayed."""
+    try:
+        _append_journal_record({'type': 'abort', 'id': entry_id}, sync=True)
+        return True
+    except Exception as e:
+        print(f"Error aborting profile save journal entry: {e}")
+        return False
+
+def _compact_profile_journal():
+    try:
+        if os.path.getsize(PROFILE_JOURNAL_FILE) < PROFILE_JOURNAL_COMPACT_BYTES:
+            return
+        with _journal_lock:
+            # Rewrite in place so workers blocked on the lock keep appending to the same file
+            with open(PROFILE_JOURNAL_FILE, 'r+', encoding='utf-8') as f:
+                _lock_journal(f)
+                outstanding = _outstanding_journal_entries(f)
+                f.seek(0)
+                f.truncate()
+                for entry, state in outstanding:
+                    f.write(json.dumps(entry) + '\n')
+                    if state == 'unlogged':
+                        f.write(json.dumps({'type': 'commit', 'id': entry['id'], 'logged': False}) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+    except Exception as e:
+        print(f"Error compacting profile save journal: {e}")
+
+def _csv_file_is_intact(path):
+    """False if path cannot be parsed cleanly: a malformed row, or one whose width differs from the header."""
+    try:
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            rows = csv.reader(f, strict=True)
+            width = len(next(rows, []))
+            return all(len(row) == width for row in rows)
+    except FileNotFoundError:
+        return True
+    except (csv.Error, UnicodeDecodeError) as e:
+        print(f"Cannot parse {path}: {e}")
+        return False
+
+def recover_profile_journal():
+    """
+    Rolls forward the latest unresolved profile save of each listing, applying only the
+    fields it changed and writing each data file once for the whole batch, appends any
+    profile log rows still missing, then empties the journal. The journal is kept if the
+    data files cannot be parsed cleanly. Returns the number of saves rolled forward.
+    """
+    if not os.path.exists(PROFILE_JOURNAL_FILE):
+        return 0
+    with data_write_lock(), _journal_lock:
+        with open(PROFILE_JOURNAL_FILE, 'r+', encoding='utf-8') as f:
+            _lock_journal(f)
+            outstanding = _outstanding_journal_entries(f)
+            pending = [entry for entry, state in outstanding if state == 'replay']
+            if outstanding:
+                if not all(_csv_file_is_intact(path) for path in (LISTING_DATA_FILE, LIVE_LISTING_DETAILS_FILE)):
+                    print("CRITICAL: data files are damaged; profile save journal kept for manual recovery.")
+                    return 0
+                listings = load_listings()
+                listings_by_timestamp = {listing.get('created_timestamp'): listing for listing in listings}
+                all_live_details = load_live_details()
+                for entry in pending:
+                    core_listing = listings_by_timestamp.get(entry['listing_timestamp'])
+                    if core_listing is not None:
+                        core_listing.update(entry['core_changes'])
+                    live_details = all_live_details.get(entry['listing_timestamp'])
+                    if live_details is not None:
+                        live_details.update(entry['live_changes'])
+                    else:
+                        all_live_details[entry['listing_timestamp']] = entry['live_details']
+
+                # Profile log rows may already have been appended before the crash
+                affected = {entry['listing_timestamp'] for entry, _ in outstanding}
+                logged = set()
+                try:
+                    with open(PROFILE_LOG_FILE, 'r', newline='', encoding='utf-8') as log_f:
+                        for row in csv.DictReader(log_f):
+                            if row.get('listing_timestamp') in affected:
+                                logged.add((row['log_timestamp'], row['listing_timestamp'], row['field_name']))
+                except FileNotFoundError:
+                    pass
+                missing_logs = [
+                    row for entry, _ in outstanding for row in entry['profile_log']
+                    if (row['log_timestamp'], row['listing_timestamp'], row['field_name']) not in logged
+                ]
+
+                if pending and not (update_all_listings(listings) and update_all_live_details(all_live_details)):
+                    print("CRITICAL: profile save journal recovery failed; journal kept and retried by the next write.")
+                    return 0
+                if not append_profile_log_entries(missing_logs):
+                    print("CRITICAL: profile save journal recovery failed; journal kept and retried by the next write.")
+                    return 0
+                _fsync_paths([PROFILE_LOG_FILE])
+                for entry in pending:
+                    log_action('PROFILE_SAVE_RECOVERED', entry['profile_log'][0]['editor_username'] if entry['profile_log'] else 'system',
+                               f"Completed interrupted profile save (TS: {entry['listing_timestamp']})")
+
+            f.seek(0)
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+    return len(pending)
+
+# ----------------------------------------------------------------------
+## Warm Start
+# ----------------------------------------------------------------------
+
+def _snapshot_sources():
+    return {
+        DATA_FILE: _parse_users_file,
+        LISTING_DATA_FILE: _parse_listings_file,
+        LIVE_LISTING_DETAILS_FILE: _parse_live_details_file,
+        GLOBAL_AMENITIES_FILE: _parse_global_amenities_file,
+    }
+
+def save_data_snapshot():
+    """Writes the cached parse of every snapshot source to DATA_SNAPSHOT_FILE."""
+    entries = {path: _data_cache[path] for path in _snapshot_sources() if path in _data_cache}
+    tmp_path = f"{DATA_SNAPSHOT_FILE}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'version': DATA_SNAPSHOT_VERSION, 'entries': entries}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, DATA_SNAPSHOT_FILE)
         return True
     except Exception as e:
-        print(f"Error saving new global amenity: {e}")
+        print(f"Error saving data snapshot: {e}")
         return False
 
+def warm_data_cache():
+    """
+    Fills the parsed-data cache at boot. Snapshot entries are reused only when their
+    recorded stamp (mtime, size, write generation) still matches the source CSV;
+    anything else is re-parsed and the snapshot is refreshed.
+    """
+    entries = {}
+    if DATA_SNAPSHOT_ENABLED:
+        try:
+            with open(DATA_SNAPSHOT_FILE, 'rb') as f:
+                snapshot = pickle.load(f)
+            if snapshot.get('version') == DATA_SNAPSHOT_VERSION:
+                entries = snapshot.get('entries', {})
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Ignoring unreadable data snapshot: {e}")
+
+    stale = False
+    for path, parser in _snapshot_sources().items():
+        entry = entries.get(path)
+        if entry is not None and entry[0] == _file_stamp(path):
+            _data_cache[path] = entry
+        else:
+            _cached_parse(path, parser)
+            stale = True
+
+    if stale and DATA_SNAPSHOT_ENABLED:
+        save_data_snapshot()
+
+if DATA_ROLE != 'reader':
+    recover_profile_journal()
+    warm_data_cache()
+if DATA_ROLE == 'writer':
+    publish_replica_snapshot(force=True)
+
+# ----------------------------------------------------------------------
+## Full-Text Listing Search
+# ----------------------------------------------------------------------
+
+_SEARCH_TOKEN_RE = re.compile(r'[a-z]+|[0-9]+')
+
+def tokenize_search_text(text):
+    """Lower-cases and splits text into words and numbers, so '3BHK' and '3 BHK' both give ['3', 'bhk']."""
+    return [token for token in _SEARCH_TOKEN_RE.findall(str(text or '').lower()) if token not in SEARCH_STOPWORDS]
+
+class ListingSearchIndex:
+    """Inverted index over listing names, location and profile text, ranked with BM25."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._postings = {} # term -> {listing timestamp: weighted term frequency}
+            self._doc_terms = {} # listing timestamp -> {term: weighted term frequency}
+            self._doc_lengths = {}
+            self._total_length = 0
+            self._summaries = {} # listing timestamp -> fields returned with each hit
+            self._vocabulary = [] # sorted terms, for prefix lookups
+
+    def index_listing(self, core_listing, live_details=None):
+        """Adds or replaces one listing. Listings consultants cannot see (deleted, expired, sold...) are dropped from the index."""
+        timestamp = core_listing.get('created_timestamp')
+        if not timestamp:
+            return
+        live_details = live_details or {}
+        with self._lock:
+            self.remove_listing(timestamp)
+            if core_listing.get('status') not in VISIBLE_LISTING_STATUSES:
+                return
+
+            term_counts = collections.Counter()
+            for field, weight in SEARCH_FIELD_WEIGHTS.items():
+                value = core_listing.get(field) if field in core_listing else live_details.get(field)
+                for token in tokenize_search_text(value):
+                    term_counts[token] += weight
+
+            for term, count in term_counts.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = {}
+                    insort_index = bisect.bisect_left(self._vocabulary, term)
+                    self._vocabulary.insert(insort_index, term)
+                postings[timestamp] = count
+
+            length = sum(term_counts.values())
+            self._doc_terms[timestamp] = term_counts
+            self._doc_lengths[timestamp] = length
+            self._total_length += length
+            self._summaries[timestamp] = {
+                'created_timestamp': timestamp,
+                'builder_username': core_listing.get('builder_username', ''),
+                'property_name': core_listing.get('property_name', ''),
+                'location': core_listing.get('location', ''),
+                'unit_type': core_listing.get('unit_type', ''),
+                'listing_price': core_listing.get('listing_price', ''),
+                'status': core_listing.get('status', ''),
+                'apartment_name': live_details.get('apartment_name', '')
+            }
+
+    def remove_listing(self, timestamp):
+        with self._lock:
+            term_counts = self._doc_terms.pop(timestamp, None)
+            if term_counts is None:
+                return
+            for term in term_counts:
+                postings = self._postings[term]
+                del postings[timestamp]
+                if not postings:
+                    del self._postings[term]
+                    del self._vocabulary[bisect.bisect_left(self._vocabulary, term)]
+            self._total_length -= self._doc_lengths.pop(timestamp)
+            del self._summaries[timestamp]
+
+    def _terms_with_prefix(self, prefix):
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        terms = []
+        for term in self._vocabulary[start:]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def suggest(self, prefix, limit=10):
+        """Returns indexed terms starting with prefix, most common first."""
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        with self._lock:
+            terms = self._terms_with_prefix(prefix)
+            return sorted(terms, key=lambda term: (-len(self._postings[term]), term))[:limit]
+
+    def search(self, query, limit=20):
+        """Ranks listings against query with BM25. Query terms that are not indexed match as prefixes."""
+        with self._lock:
+            doc_count = len(self._doc_terms)
+            if not doc_count:
+                return []
+            avg_length = self._total_length / doc_count
+
+            scores = collections.defaultdict(float)
+            for token in set(tokenize_search_text(query)):
+                if token in self._postings:
+                    terms = [token]
+                else:
+                    terms = self.suggest(token, SEARCH_PREFIX_EXPANSIONS)
+                for term in terms:
+                    postings = self._postings[term]
+                    idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for timestamp, tf in postings.items():
+                        norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_lengths[timestamp] / avg_length)
+                        scores[timestamp] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+            return [dict(self._summaries[timestamp], score=round(score, 4)) for timestamp, score in best]
+
+search_index = ListingSearchIndex()
+_search_index_stamps = None
+_search_index_lock = threading.Lock()
+
+def _search_source_stamps():
+    return (data_source_stamp(LISTING_DATA_FILE), data_source_stamp(LIVE_LISTING_DETAILS_FILE))
+
+def get_search_index():
+    """Returns the search index, rebuilding it only if another process changed the listing files."""
+    global _search_index_stamps
+    with _search_index_lock:
+        stamps = _search_source_stamps()
+        if stamps != _search_index_stamps:
+            all_live_details = load_live_details()
+            search_index.clear()
+            for listing in load_listings():
+                search_index.index_listing(listing, all_live_details.get(listing.get('created_timestamp')))
+            _search_index_stamps = stamps
+    return search_index
+
+def reindex_listings(entries, stamps_before):
+    """
+    Applies saved listing changes, given as (core_listing, live_details) pairs, to the search
+    index without a full rebuild. stamps_before is _search_source_stamps() taken before the
+    write; call this while still holding data_write_lock so nothing else has written since.
+    If the index was not built from exactly stamps_before, another writer changed the files
+    first, so the stamps are left alone and the next search rebuilds from the files.
+    """
+    global _search_index_stamps
+    with _search_index_lock:
+        if _search_index_stamps is None or _search_index_stamps != stamps_before:
+            return
+        for core_listing, live_details in entries:
+            search_index.index_listing(core_listing, live_details)
+        _search_index_stamps = _search_source_stamps()
+
+get_search_index()
+
+# ----------------------------------------------------------------------
+## Geocoding and Proximity Index
+# ----------------------------------------------------------------------
+
+def _normalize_place_name(name):
+    return ' '.join(re.findall(r'[a-z0-9]+', str(name or '').lower()))
+
+def _parse_gazetteer_file():
+    gazetteer = {}
+    try:
+        with open(LOCATION_GAZETTEER_FILE, 'r', newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                try:
+                    gazetteer[_normalize_place_name(row['name'])] = (float(row['latitude']), float(row['longitude']))
+                except (KeyError, TypeError, ValueError):
+                    continue
+    except FileNotFoundError:
+        pass
+    return gazetteer
+
+def geocode_location(location):
+    """
+    Resolves a free-text location to (latitude, longitude) using the offline gazetteer,
+    or returns None. Tries the whole string, then each comma-separated part, then the
+    longest gazetteer name that appears in it as whole words.
+    """
+    gazetteer = _cached_parse(LOCATION_GAZETTEER_FILE, _parse_gazetteer_file)
+    normalized = _normalize_place_name(location)
+    if not normalized:
+        return None
+    if normalized in gazetteer:
+        return gazetteer[normalized]
+    for part in str(location).split(','):
+        part = _normalize_place_name(part)
+        if part in gazetteer:
+            return gazetteer[part]
+    padded = f" {normalized} "
+    for name in sorted(gazetteer, key=len, reverse=True):
+        if f" {name} " in padded:
+            return gazetteer[name]
+    return None
+
+def fill_listing_coordinates(listing):
+    """Sets latitude/longitude from the listing's location; both are left empty if it cannot be resolved."""
+    coordinates = geocode_location(listing.get('location'))
+    if coordinates:
+        listing['latitude'], listing['longitude'] = f"{coordinates[0]:.6f}", f"{coordinates[1]:.6f}"
+    else:
+        listing['latitude'], listing['longitude'] = '', ''
+
+def _listing_coordinates(listing):
+    try:
+        latitude, longitude = float(listing.get('latitude')), float(listing.get('longitude'))
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return latitude, longitude
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+class ListingGeoIndex:
+    """Uniform lat/lon grid over listings with coordinates, for radius and bounding-box queries."""
+
+    def __init__(self, cell_degrees=GEO_GRID_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self._cells = collections.defaultdict(list) # (lat cell, lon cell) -> [(lat, lon, listing)]
+        self._count = 0
+
+    def _cell(self, latitude, longitude):
+        return (math.floor(latitude / self.cell_degrees), math.floor(longitude / self.cell_degrees))
+
+    def add(self, listing):
+        coordinates = _listing_coordinates(listing)
+        if coordinates is None:
+            return
+        self._cells[self._cell(*coordinates)].append((coordinates[0], coordinates[1], listing))
+        self._count += 1
+
+    def _candidates(self, min_lat, min_lon, max_lat, max_lon):
+        low_lat, low_lon = self._cell(min_lat, min_lon)
+        high_lat, high_lon = self._cell(max_lat, max_lon)
+        if (high_lat - low_lat + 1) * (high_lon - low_lon + 1) > len(self._cells):
+            # Huge area: walking the occupied cells is cheaper than probing empty ones
+            for (cell_lat, cell_lon), points in self._cells.items():
+                if low_lat <= cell_lat <= high_lat and low_lon <= cell_lon <= high_lon:
+                    yield from points
+            return
+        for cell_lat in range(low_lat, high_lat + 1):
+            for cell_lon in range(low_lon, high_lon + 1):
+                yield from self._cells.get((cell_lat, cell_lon), ())
+
+    def within_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        return [
+            listing for latitude, longitude, listing in self._candidates(min_lat, min_lon, max_lat, max_lon)
+            if min_lat <= latitude <= max_lat and min_lon <= longitude <= max_lon
+        ]
+
+    def within_radius(self, latitude, longitude, radius_km):
+        """Returns (distance_km, listing) pairs within radius_km, nearest first."""
+        lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+        lon_delta = lat_delta / max(math.cos(math.radians(latitude)), 1e-6)
+        hits = []
+        for point_lat, point_lon, listing in self._candidates(latitude - lat_delta, longitude - lon_delta, latitude + lat_delta, longitude + lon_delta):
+            distance = haversine_km(latitude, longitude, point_lat, point_lon)
+            if distance <= radius_km:
+                hits.append((distance, listing))
+        hits.sort(key=lambda hit: hit[0])
+        return hits
+
+_geo_index = None
+_geo_index_stamp = None
+_geo_index_lock = threading.Lock()
+
+def get_geo_index():
+    """Returns the proximity index, rebuilding it only after the core listings file changed."""
+    global _geo_index, _geo_index_stamp
+    with _geo_index_lock:
+        stamp = data_source_stamp(LISTING_DATA_FILE)
+        if _geo_index is None or stamp != _geo_index_stamp:
+            index = ListingGeoIndex()
+            for listing in load_listings():
+                # Same visibility rule as the search index: only listings consultants can see
+                if listing.get('status') in VISIBLE_LISTING_STATUSES:
+                    index.add(listing)
+            _geo_index, _geo_index_stamp = index, stamp
+        return _geo_index
+
+@app.cli.command('geocode-listings')
+@click.option('--overwrite', is_flag=True, help='Re-geocode listings that already have coordinates.')
+def geocode_listings_command(overwrite):
+    """Fills in latitude/longitude for listings from the offline gazetteer."""
+    initialize_data_file()
+    listings = load_listings()
+    filled = 0
+    unresolved = set()
+    for listing in listings:
+        if not overwrite and _listing_coordinates(listing):
+            continue
+        fill_listing_coordinates(listing)
+        if listing['latitude']:
+            filled += 1
+        elif listing.get('location'):
+            unresolved.add(listing['location'])
+    if filled and not update_all_listings(listings):
+        raise click.ClickException("Could not save geocoded listings.")
+    click.echo(f"Geocoded {filled} listing(s).")
+    for location in sorted(unresolved):
+        click.echo(f"Not in gazetteer: {location}")
+
+# ----------------------------------------------------------------------
+## Listing Change Feed
+# ----------------------------------------------------------------------
+
+# Event ids are "<epoch>-<seq>". The epoch changes whenever a process starts, so a client
+# reconnecting to a restarted (or different) worker is told to reload instead of missing events.
+# It is generated lazily per pid: under --preload the module is imported once and then forked.
+_change_feed_epoch = (None, None)
+
+def change_feed_epoch():
+    """Returns this worker process's change feed epoch."""
+    global _change_feed_epoch
+    pid, epoch = _change_feed_epoch
+    if pid != os.getpid():
+        pid = os.getpid()
+        epoch = f"{pid}x{int(time.time() * 1000)}"
+        _change_feed_epoch = (pid, epoch)
+    return epoch
+
+_change_feed = collections.deque(maxlen=CHANGE_FEED_BUFFER_SIZE)
+_change_feed_seq = 0
+_change_feed_cond = threading.Condition()
+_change_feed_streams = threading.BoundedSemaphore(CHANGE_FEED_MAX_STREAMS)
+
+def publish_listing_change(change_type, listing_timestamp, builder_username, changes):
+    """Records a listing change and wakes every open /listing_changes stream."""
+    global _change_feed_seq
+    with _change_feed_cond:
+        _change_feed_seq += 1
+        event = {
+            'seq': _change_feed_seq,
+            'type': change_type,
+            'listing_timestamp': listing_timestamp,
+            'builder_username': builder_username,
+            'changes': changes,
+            'timestamp': datetime.datetime.now().isoformat()
+        }
+        _change_feed.append(event)
+        _change_feed_cond.notify_all()
+    return event
+
+def _parse_change_event_id(event_id):
+    """Returns the sequence number from an event id of this process, or None if it cannot be replayed."""
+    epoch, _, seq = (event_id or '').partition('-')
+    if epoch != change_feed_epoch() or not seq.isdigit():
+        return None
+    return int(seq)
+
+def listing_changes_since(seq):
+    """Returns (events after seq, complete); complete is False once the buffer has dropped events after seq."""
+    with _change_feed_cond:
+        if seq > _change_feed_seq:
+            return [], False
+        complete = not _change_feed or _change_feed[0]['seq'] <= seq + 1
+        return [event for event in _change_feed if event['seq'] > seq], complete
+
+def _format_sse(event_name, seq, payload):
+    return f"id: {change_feed_epoch()}-{seq}\nevent: {event_name}\ndata: {json.dumps(payload)}\n\n"
+
+def _replica_version_stream(last_event_id):
+    """
+    The /listing_changes stream on a reader. Readers never see individual writes, only new
+    snapshot versions, so each version bump is sent as a 'reset' event whose id carries the
+    version; a client reconnecting from an older version is reset straight away.
+    """
+    snapshot = current_replica_snapshot()
+    version = snapshot.version if snapshot else 0
+    yield "retry: 3000\n\n"
+    if last_event_id and _parse_change_event_id(last_event_id) != version:
+        yield _format_sse('reset', version, {'version': version})
+    last_sent = time.monotonic()
+    deadline = last_sent + CHANGE_FEED_MAX_STREAM_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(REPLICA_SNAPSHOT_CHECK_SECONDS)
+        snapshot = current_replica_snapshot()
+        if snapshot and snapshot.version != version:
+            version = snapshot.version
+            yield _format_sse('reset', version, {'version': version})
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= CHANGE_FEED_KEEPALIVE_SECONDS:
+            yield ": keepalive\n\n"
+            last_sent = time.monotonic()
+
+@app.route('/listing_changes', methods=['GET'])
+def listing_changes():
+    """
+    Server-Sent Events stream of listing changes, optionally filtered by ?builder= or ?listing=.
+    Reconnecting clients resume from Last-Event-ID (or ?since=); a 'reset' event means the
+    gap could not be replayed and the client should reload its listings in full.
+    On a reader the stream only carries a 'reset' per new snapshot version (filters are
+    ignored); route clients to the writer for individual change events.
+    """
+    builder_filter = request.args.get('builder')
+    listing_filter = request.args.get('listing')
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+
+    with _change_feed_cond:
+        current_seq = _change_feed_seq
+    start_seq = current_seq
+    needs_reset = False
+    if last_event_id:
+        resume_seq = _parse_change_event_id(last_event_id)
+        if resume_seq is None or not listing_changes_since(resume_seq)[1]:
+            needs_reset = True
+        else:
+            start_seq = resume_seq
+
+    def matches(event):
+        if builder_filter and event['builder_username'] != builder_filter:
+            return False
+        if listing_filter and event['listing_timestamp'] != listing_filter:
+            return False
+        return True
+
+    def stream():
+        seq = start_seq
+        yield "retry: 3000\n\n"
+        if needs_reset:
+            yield _format_sse('reset', seq, {})
+        deadline = time.monotonic() + CHANGE_FEED_MAX_STREAM_SECONDS
+        while time.monotonic() < deadline:
+            with _change_feed_cond:
+                if _change_feed_seq <= seq:
+                    _change_feed_cond.wait(timeout=CHANGE_FEED_KEEPALIVE_SECONDS)
+            events, complete = listing_changes_since(seq)
+            if not complete:
+                with _change_feed_cond:
+                    seq = _change_feed_seq
+                yield _format_sse('reset', seq, {})
+                continue
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+            for event in events:
+                seq = event['seq']
+                if matches(event):
+                    yield _format_sse('listing_change', seq, event)
+
+    # Each open stream holds a worker thread, so only CHANGE_FEED_MAX_STREAMS run at once; past
+    # that the client is told to retry later and the thread is freed straight away.
+    if not _change_feed_streams.acquire(blocking=False):
+        response = Response(f"retry: {CHANGE_FEED_BUSY_RETRY_MS}\n\n", mimetype='text/event-stream')
+    else:
+        events = _replica_version_stream(last_event_id) if DATA_ROLE == 'reader' else stream()
+        response = Response(events, mimetype='text/event-stream')
+        response.call_on_close(_change_feed_streams.release)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# ----------------------------------------------------------------------
+## Listing Expiry Sweeper
+# ----------------------------------------------------------------------
+
+# Min-heap of (expiry_date, created_timestamp) for listings that can still expire.
+# Rebuilt only when the core listings file changes, so an idle tick is a stat() and a peek.
+_expiry_heap = []
+_expiry_heap_mtime = None
+_expiry_lock = threading.Lock()
+_expiry_sweeper_thread = None
+
+def _parse_expiry_date(value):
+    """Returns the expiry as a date, or None if the field is empty or malformed."""
+    try:
+        return datetime.date.fromisoformat((value or '').strip()[:10])
+    except ValueError:
+        return None
+
+def _listing_file_mtime():
+    try:
+        return os.path.getmtime(LISTING_DATA_FILE)
+    except OSError:
+        return None
+
+def rebuild_expiry_index():
+    """Rebuilds the expiry min-heap from the core listings file."""
+    global _expiry_heap, _expiry_heap_mtime
+    # Take the mtime before reading so a concurrent write triggers another rebuild.
+    mtime = _listing_file_mtime()
+    heap = []
+    for listing in load_listings():
+        if listing.get('status') in EXPIRY_EXEMPT_STATUSES or not listing.get('created_timestamp'):
+            continue
+        expiry = _parse_expiry_date(listing.get('expiry_date'))
+        if expiry:
+            heap.append((expiry, listing['created_timestamp']))
+    heapq.heapify(heap)
+    _expiry_heap = heap
+    _expiry_heap_mtime = mtime
+
+def sweep_expired_listings(today=None):
+    """
+    Moves every listing whose expiry_date has passed to the 'Expired' status.
+    All transitions are saved in a single rewrite of the listings file and each one
+    is recorded in the action log. Returns the number of listings expired.
+    """
+    global _expiry_heap_mtime
+    today = today or datetime.date.today()
+    with _expiry_lock:
+        if _listing_file_mtime() != _expiry_heap_mtime:
+            rebuild_expiry_index()
+
+        if not _expiry_heap or _expiry_heap[0][0] >= today:
+            return 0
+
+        due_timestamps = set()
+        while _expiry_heap and _expiry_heap[0][0] < today:
+            due_timestamps.add(heapq.heappop(_expiry_heap)[1])
+
+        # Hold the write lock from load to rewrite so a concurrent builder edit is not overwritten.
+        with data_write_lock():
+            # Heap entries may be stale (expiry edited, listing sold), so re-check against the file.
+            listings = load_listings()
+            expired = []
+            for listing in listings:
+                if listing.get('created_timestamp') not in due_timestamps or listing.get('status') in EXPIRY_EXEMPT_STATUSES:
+                    continue
+                expiry = _parse_expiry_date(listing.get('expiry_date'))
+                if expiry and expiry < today:
+                    listing['status'] = EXPIRED_LISTING_STATUS
+                    expired.append(listing)
+
+            if not expired:
+                return 0
+
+            search_stamps = _search_source_stamps()
+            if not update_all_listings(listings):
+                # Force a rebuild on the next tick so the popped entries are retried.
+                _expiry_heap_mtime = None
+                return 0
+            all_live_details = load_live_details()
+            reindex_listings([(listing, all_live_details.get(listing['created_timestamp'])) for listing in expired], search_stamps)
+
+    for listing in expired:
+        log_action('LISTING_EXPIRED', listing.get('builder_username'), f"Listing expired: {listing.get('property_name', 'N/A')} (TS: {listing['created_timestamp']}, expiry: {listing.get('expiry_date')})")
+        publish_listing_change('expired', listing['created_timestamp'], listing.get('builder_username'), {'status': EXPIRED_LISTING_STATUS})
+    return len(expired)
+
+def _expiry_sweeper_loop():
+    while True:
+        try:
+            if sweep_expired_listings() and DATA_ROLE == 'writer':
+                request_replica_publish()
+        except Exception as e:
+            print(f"Error during listing expiry sweep: {e}")
+        time.sleep(EXPIRY_SWEEP_INTERVAL_SECONDS)
+
+def start_expiry_sweeper():
+    """Starts the background expiry sweeper once per process."""
+    global _expiry_sweeper_thread
+    if EXPIRY_SWEEP_INTERVAL_SECONDS <= 0 or _expiry_sweeper_thread is not None:
+        return
+    _expiry_sweeper_thread = threading.Thread(target=_expiry_sweeper_loop, name='expiry-sweeper', daemon=True)
+    _expiry_sweeper_thread.start()
+
+# ----------------------------------------------------------------------
+## Media Manifest and Orphan Reconciliation
+# ----------------------------------------------------------------------
+
+_media_gc_lock = threading.Lock()
+_media_gc_thread = None
+
+def media_dir_name(listing_timestamp):
+    # **FIX:** Replace colons with hyphens for Windows compatibility
+    return listing_timestamp.replace(':', '-')
+
+def save_media_manifest_entries(entries):
+    """Appends one manifest row per successfully saved upload."""
+    try:
+        with open(MEDIA_MANIFEST_FILE, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=MEDIA_MANIFEST_FIELD_NAMES)
+            writer.writerows(entries)
+        return True
+    except Exception as e:
+        print(f"Error saving media manifest: {e}")
+        return False
+    finally:
+        _invalidate_cached(MEDIA_MANIFEST_FILE)
+
+def _parse_media_manifest_file():
+    manifest = set()
+    try:
+        with open(MEDIA_MANIFEST_FILE, 'r', newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                if row.get('media_dir') and row.get('filename'):
+                    manifest.add((row['media_dir'], row['filename']))
+    except FileNotFoundError:
+        pass
+    return manifest
+
+def _load_media_gc_checkpoint():
+    try:
+        with open(MEDIA_GC_CHECKPOINT_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"Ignoring unreadable media GC checkpoint: {e}")
+        return {}
+
+def _save_media_gc_checkpoint(checkpoint):
+    tmp_path = f"{MEDIA_GC_CHECKPOINT_FILE}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, indent=2)
+        os.replace(tmp_path, MEDIA_GC_CHECKPOINT_FILE)
+        return True
+    except Exception as e:
+        print(f"Error saving media GC checkpoint: {e}")
+        return False
+
+def reconcile_media(remove=None, restart=False, batch_size=None, now=None):
+    """
+    Examines the next batch of media/<listing> directories after the checkpoint cursor.
+    A directory is orphaned when no listing owns it or its listing is soft-deleted; a
+    file is orphaned when the media manifest has no row for it (e.g. a half-failed
+    upload). Orphans are reported when first seen and, with remove enabled, deleted
+    once they have stayed orphaned for MEDIA_GC_RETENTION_DAYS.
+    """
+    remove = MEDIA_GC_REMOVE if remove is None else remove
+    batch_size = batch_size or MEDIA_GC_BATCH_SIZE
+    now = now or datetime.datetime.now()
+    retention = datetime.timedelta(days=MEDIA_GC_RETENTION_DAYS)
+    report = {'scanned': 0, 'orphans': [], 'removed': [], 'cursor': ''}
+
+    with _media_gc_lock:
+        checkpoint = _load_media_gc_checkpoint()
+        pending = checkpoint.get('pending', {}) # relative path -> first time it was seen orphaned
+        cursor = '' if restart else checkpoint.get('cursor', '')
+
+        try:
+            dir_names = sorted(entry.name for entry in os.scandir(MEDIA_DIR) if entry.is_dir())
+        except FileNotFoundError:
+            dir_names = []
+        batch = [name for name in dir_names if name > cursor][:batch_size]
+        # A short batch means the end of the tree was reached; the next run starts over
+        report['cursor'] = batch[-1] if len(batch) == batch_size else ''
+        report['scanned'] = len(batch)
+
+        listing_status = {media_dir_name(l['created_timestamp']): l.get('status') for l in load_listings() if l.get('created_timestamp')}
+        manifest = _cached_parse(MEDIA_MANIFEST_FILE, _parse_media_manifest_file)
+
+        orphans = {}
+        for dir_name in batch:
+            status = listing_status.get(dir_name)
+            if status is None:
+                orphans[dir_name] = 'no matching listing'
+            elif status == 'Deleted':
+                orphans[dir_name] = 'listing soft-deleted'
+            else:
+                for filename in os.listdir(os.path.join(MEDIA_DIR, dir_name)):
+                    if (dir_name, filename) not in manifest:
+                        orphans[f"{dir_name}/{filename}"] = 'not in media manifest'
+
+        # Forget pending entries that were resolved (listing restored, file removed by hand, ...)
+        batch_dirs = set(batch)
+        existing_dirs = set(dir_names)
+        for path in list(pending):
+            top_dir = path.split('/', 1)[0]
+            if top_dir not in existing_dirs or (top_dir in batch_dirs and path not in orphans):
+                del pending[path]
+
+        for path, reason in orphans.items():
+            first_seen = pending.get(path)
+            if first_seen is None:
+                pending[path] = now.isoformat()
+                report['orphans'].append({'path': path, 'reason': reason, 'first_seen': pending[path]})
+                log_action('MEDIA_ORPHAN_FOUND', 'system', f"Orphaned media {path}: {reason}")
+                continue
+
+            report['orphans'].append({'path': path, 'reason': reason, 'first_seen': first_seen})
+            if not remove or now - datetime.datetime.fromisoformat(first_seen) < retention:
+                continue
+
+            full_path = os.path.join(MEDIA_DIR, *path.split('/'))
+            try:
+                if os.path.isdir(full_path):
+                    shutil.rmtree(full_path)
+                else:
+                    os.remove(full_path)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Error removing orphaned media {path}: {e}")
+                continue
+            del pending[path]
+            report['removed'].append(path)
+            log_action('MEDIA_ORPHAN_REMOVED', 'system', f"Removed orphaned media {path}: {reason}")
+
+        _save_media_gc_checkpoint({'cursor': report['cursor'], 'pending': pending, 'last_run': now.isoformat()})
+    return report
+
+def _media_gc_loop():
+    while True:
+        try:
+            reconcile_media()
+        except Exception as e:
+            print(f"Error during media reconciliation: {e}")
+        time.sleep(MEDIA_GC_INTERVAL_SECONDS)
+
+def start_media_gc():
+    """Starts the background media reconciliation job once per process."""
+    global _media_gc_thread
+    if MEDIA_GC_INTERVAL_SECONDS <= 0 or _media_gc_thread is not None:
+        return
+    _media_gc_thread = threading.Thread(target=_media_gc_loop, name='media-gc', daemon=True)
+    _media_gc_thread.start()
+
+@app.cli.command('reconcile-media')
+@click.option('--remove', is_flag=True, help='Delete orphans that have outlived the retention window.')
+def reconcile_media_command(remove):
+    """Runs a full media reconciliation pass and prints every orphan."""
+    initialize_data_file()
+    restart = True
+    while True:
+        report = reconcile_media(remove=remove, restart=restart)
+        restart = False
+        for orphan in report['orphans']:
+            click.echo(f"{orphan['path']}\t{orphan['reason']}\t(first seen {orphan['first_seen']})")
+        for path in report['removed']:
+            click.echo(f"removed {path}")
+        if not report['cursor']:
+            break
+
+@app.before_request
+def _lazy_startup():
+    """Creates missing data files and starts background work on the first request in each process."""
+    global _startup_done
+    if _startup_done:
+        return
+    with _startup_lock:
+        if not _startup_done:
+            # Readers never write, so file creation and the background jobs belong to the writer
+            if DATA_ROLE != 'reader':
+                initialize_data_file()
+                start_expiry_sweeper()
+                start_media_gc()
+            if DATA_ROLE == 'writer':
+                start_replica_publisher()
+                # initialize_data_file may have migrated the CSVs after the import-time publish
+                request_replica_publish()
+            _startup_done = True
+
+# ----------------------------------------------------------------------
+## Rate Limiting
+# ----------------------------------------------------------------------
+
+class TokenBucketStore(abc.ABC):
+    """
+    Interface for rate-limit bucket storage, installed with set_rate_limit_store().
+    SQLiteTokenBucketStore shares buckets between the workers of one host;
+    InMemoryTokenBucketStore is the process-local stand-in.
+    """
+
+    @abc.abstractmethod
+    def take(self, key, capacity, refill_rate):
+        """Consumes one token from key's bucket. Returns 0 if allowed, else the seconds until a token is free."""
+
+class InMemoryTokenBucketStore(TokenBucketStore):
+    """Process-local token buckets, evicting the least recently used key beyond max_keys."""
+
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = collections.OrderedDict() # key -> (tokens, last refill time), least recently used first
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, refill_rate, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - last) * refill_rate)
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+            # The evicted key is the longest idle one; forgetting it at worst grants a fresh bucket
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return 0 if allowed else (1 - tokens) / refill_rate
+
+class SQLiteTokenBucketStore(TokenBucketStore):
+    """
+    Token buckets in a SQLite file, so every gunicorn worker draws from the same budget.
+    Each take is one IMMEDIATE transaction, which SQLite serializes across processes.
+    A missing row is a full bucket, so rows that have refilled completely are dropped,
+    and past max_keys the least recently used rows go as in InMemoryTokenBucketStore.
+    """
+
+    def __init__(self, path, max_keys=RATE_LIMIT_MAX_KEYS, prune_every=RATE_LIMIT_PRUNE_EVERY):
+        self.path = path
+        self.max_keys = max_keys
+        self.prune_every = prune_every
+        self._local = threading.local()
+        self._takes = 0
+
+    def _connection(self):
+        # One connection per thread, reopened after a fork (connections must not cross processes)
+        if getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF') # Losing recent takes in a crash only refills buckets
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS buckets ('
+                'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, full_at REAL NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS buckets_updated_at ON buckets (updated_at)')
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return self._local.connection
+
+    def take(self, key, capacity, refill_rate, now=None):
+        # Wall-clock time: monotonic clocks are not comparable between processes
+        now = time.time() if now is None else now
+        try:
+            connection = self._connection()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = connection.execute('SELECT tokens, updated_at FROM buckets WHERE key = ?', (key,)).fetchone()
+                tokens, last = row if row else (capacity, now)
+                tokens = min(capacity, tokens + max(0.0, now - last) * refill_rate)
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                connection.execute(
+                    'INSERT OR REPLACE INTO buckets (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?)',
+                    (key, tokens, now, now + (capacity - tokens) / refill_rate)
+                )
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            self._takes += 1
+            if self._takes % self.prune_every == 0:
+                self._prune(connection, now)
+        except sqlite3.Error as e:
+            # Fail open: a broken limiter file must not take the login routes down with it
+            print(f"Error using rate limit store {self.path}: {e}")
+            return 0
+        return 0 if allowed else (1 - tokens) / refill_rate
+
+    def _prune(self, connection, now):
+        connection.execute('DELETE FROM buckets WHERE full_at <= ?', (now,))
+        connection.execute(
+            'DELETE FROM buckets WHERE key IN (SELECT key FROM buckets ORDER BY updated_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_keys,)
+        )
+
+rate_limit_store = SQLiteTokenBucketStore(RATE_LIMIT_STORE_FILE) if RATE_LIMIT_STORE_FILE else InMemoryTokenBucketStore()
+
+def set_rate_limit_store(store):
+    """Replaces the bucket store, e.g. with a shared backend used by every worker."""
+    global rate_limit_store
+    if not isinstance(store, TokenBucketStore):
+        raise TypeError("Rate limit stores must implement TokenBucketStore")
+    rate_limit_store = store
+
+def _client_ip():
+    if RATE_LIMIT_TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get('X-Forwarded-For', '')
+        if forwarded:
+            # The right-most entry is the one added by our own proxy and cannot be spoofed by the client
+            return forwarded.split(',')[-1].strip()
+    return request.remote_addr or 'unknown'
+
+def _rate_limit_username():
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        return str(data.get('username') or '').strip().lower()
+    return (request.form.get('editor_username') or '').strip().lower()
+
+def _too_many_requests(retry_after):
+    response = jsonify({"success": False, "message": "Too many requests. Please wait a moment and try again."})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+@app.before_request
+def enforce_rate_limits():
+    """Rejects over-budget requests with 429 before the route touches any data file."""
+    if not RATE_LIMITS_ENABLED or request.method == 'OPTIONS' or request.endpoint not in RATE_LIMITS:
+        return None
+    capacity, refill_rate = RATE_LIMITS[request.endpoint]
+
+    # Check the IP bucket first so a flood is turned away without parsing the request body
+    retry_after = rate_limit_store.take(f"{request.endpoint}:ip:{_client_ip()}", capacity, refill_rate)
+    if retry_after:
+        return _too_many_requests(retry_after)
+
+    username = _rate_limit_username()
+    if username:
+        retry_after = rate_limit_store.take(f"{request.endpoint}:user:{username}", capacity, refill_rate)
+        if retry_after:
+            return _too_many_requests(retry_after)
+    return None
+
+# ----------------------------------------------------------------------
+## Response Encoding (JSON, Projection, Compression)
+# ----------------------------------------------------------------------
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Compact JSON provider that switches to orjson when it is available."""
+    compact = True
+
+    def dumps(self, obj, **kwargs):
+        # orjson has no indent/sort options worth matching, so pretty-printing keeps the stdlib path
+        if orjson is not None and JSON_FAST_SERIALIZER and 'indent' not in kwargs:
+            return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and JSON_FAST_SERIALIZER and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+app.json = FastJSONProvider(app)
+
+def requested_fields():
+    """Returns the set of fields named in ?fields=a,b,c, or None when no projection was asked for."""
+    fields = {name.strip() for name in request.args.get('fields', '').split(',') if name.strip()}
+    return fields or None
+
+def project_fields(record, fields):
+    """Keeps only the requested keys of record; returns it unchanged when fields is None."""
+    if not fields:
+        return record
+    return {key: value for key, value in record.items() if key in fields}
+
+def _choose_encoding(accept_encoding):
+    accepted = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+@app.after_request
+def compress_response(response):
+    """Compresses textual responses above COMPRESSION_MIN_BYTES for clients that accept it."""
+    if not COMPRESSION_ENABLED or response.status_code != 200 or 'Content-Encoding' in response.headers:
+        return response
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    # Leave generator-backed streams alone; files from send_from_directory are safe to buffer
+    if response.is_streamed and not response.direct_passthrough:
+        return response
+    if response.content_length is not None and response.content_length < COMPRESSION_MIN_BYTES:
+        return response
+
+    encoding = _choose_encoding(request.headers.get('Accept-Encoding', ''))
+    response.vary.add('Accept-Encoding')
+    if encoding is None:
+        return response
+
+    response.direct_passthrough = False
+    body = response.get_data()
+    if len(body) < COMPRESSION_MIN_BYTES:
+        return response
+
+    if encoding == 'br':
+        compressed = brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+    else:
+        compressed = gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL)
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    etag, is_weak = response.get_etag()
+    if etag and not is_weak:
+        # The encoded body is no longer byte-identical to the file the ETag was computed for
+        response.set_etag(etag, weak=True)
+    return response
+
 # ----------------------------------------------------------------------
 ## API Routes (MODIFIED/NEW)
 # ----------------------------------------------------------------------
 
 # --- NEW: Core Listing Creation ---
 @app.route('/add_listing', methods=['POST'])
+@with_data_write_lock
 def add_listing():
     data = request.json
     required_keys = ['builder_username', 'property_name', 'location', 'unit_type', 'listing_price', 'status']
@@ -357,10 +2145,15 @@ def add_listing():
         'status': data['status'],
         'created_timestamp': current_timestamp,
         # Default to empty string if not provided in the form
-        'expiry_date': data.get('expiry_date', '') 
+        'expiry_date': data.get('expiry_date', ''),
+        'latitude': data.get('latitude', ''),
+        'longitude': data.get('longitude', '')
     }
+    if not _listing_coordinates(core_listing_data):
+        fill_listing_coordinates(core_listing_data)
     
     # 3. Save core listing
+    search_stamps = _search_source_stamps()
     if not save_listing(core_listing_data):
         return jsonify({"success": False, "message": "Server error saving core listing data."}), 500
 
@@ -378,10 +2171,13 @@ def add_listing():
         print(f"Warning: Failed to save initial live details for {current_timestamp}")
 
     log_action('LISTING_CREATED', data['builder_username'], f"New core listing created: {data['property_name']}")
+    reindex_listings([(core_listing_data, initial_details)], search_stamps)
+    publish_listing_change('created', current_timestamp, data['builder_username'], core_listing_data)
     return jsonify({"success": True, "message": "New listing created successfully and profile initialized.", "timestamp": current_timestamp})
 
 # --- NEW: Core Listing Update ---
 @app.route('/update_listing', methods=['POST'])
+@with_data_write_lock
 def update_listing():
     data = request.json
     original_timestamp = data.get('original_timestamp')
@@ -394,10 +2190,12 @@ def update_listing():
     all_listings = load_listings()
     found = False
     log_messages = []
+    changed_fields = {}
     
     for listing in all_listings:
         if listing.get('created_timestamp') == original_timestamp and listing.get('builder_username') == builder_username:
             found = True
+            updated_listing = listing
             
             # Update fields and log changes
             for field, new_value in updated_data.items():
@@ -410,22 +2208,33 @@ def update_listing():
                 # Check for change and update
                 if str(old_value) != str(new_value):
                     listing[field] = new_value
+                    changed_fields[field] = new_value
                     log_messages.append(f"Core: {field} changed from '{old_value}' to '{new_value}'")
                     log_profile_change(original_timestamp, 'Core', field, old_value, new_value, builder_username)
+
+            # Re-geocode a moved listing unless the builder supplied coordinates themselves
+            if 'location' in changed_fields and 'latitude' not in updated_data and 'longitude' not in updated_data:
+                fill_listing_coordinates(listing)
+                changed_fields['latitude'], changed_fields['longitude'] = listing['latitude'], listing['longitude']
             break
 
     if not found:
         return jsonify({"success": False, "message": "Listing not found or user unauthorized."}), 404
 
     # Save all updated listings
+    search_stamps = _search_source_stamps()
     if update_all_listings(all_listings):
         log_action('LISTING_EDITED', builder_username, f"Updated core listing (TS: {original_timestamp}). Changes: {len(log_messages)}")
+        if changed_fields:
+            reindex_listings([(updated_listing, load_live_details().get(original_timestamp))], search_stamps)
+            publish_listing_change('updated', original_timestamp, builder_username, changed_fields)
         return jsonify({"success": True, "message": "Listing updated successfully.", "changes": log_messages})
     else:
         return jsonify({"success": False, "message": "Server error while saving updated data."}), 500
 
 
 @app.route('/add_global_amenity', methods=['POST'])
+@with_data_write_lock
 def add_global_amenity():
     """API endpoint to receive new amenity data and save it to the global CSV."""
     data = request.get_json()
@@ -446,25 +2255,32 @@ def add_global_amenity():
 
 @app.route('/get_listing_by_timestamp/<timestamp>', methods=['GET'])
 def get_listing_by_timestamp(timestamp):
-    # ... (Unchanged logic, relies on load_live_details)
-    all_listings = load_listings()
-    core_listing = next((l for l in all_listings if l.get('created_timestamp') == timestamp), None)
+    replica = _read_replica()
+    if replica is not None:
+        # Decode just this listing's two records from the mapped snapshot
+        core_listing = replica.listing(timestamp)
+        live_details = replica.live_detail(timestamp) or {}
+    else:
+        all_listings = load_listings()
+        core_listing = next((l for l in all_listings if l.get('created_timestamp') == timestamp), None)
+        live_details = None
     
     if not core_listing:
         return jsonify({"success": False, "message": "Core listing not found."}), 404
         
-    all_live_details = load_live_details()
-    live_details = all_live_details.get(timestamp, {})
+    if live_details is None:
+        live_details = load_live_details().get(timestamp, {})
     
     merged_data = {**core_listing, **live_details}
 
     if 'listing_timestamp' in merged_data and merged_data['listing_timestamp'] == merged_data['created_timestamp']:
         del merged_data['listing_timestamp'] 
         
-    return jsonify({"success": True, "listing": merged_data})
+    return jsonify({"success": True, "listing": project_fields(merged_data, requested_fields())})
 
 
 @app.route('/update_profile_data', methods=['POST'])
+@with_data_write_lock
 def update_profile_data():
     data = request.json
     listing_timestamp = data.get('listing_timestamp')
@@ -484,12 +2300,18 @@ def update_profile_data():
     if not core_listing:
         return jsonify({"success": False, "message": "Original listing not found."}), 404
 
+    # Kept to roll back a save that fails part-way through the file writes
+    original_core_listing = dict(core_listing)
+    original_live_details = dict(live_details) if live_details else None
+
     # If live_details are missing (e.g., if a new listing failed to save initial details), initialize it
     if not live_details:
         live_details = INITIAL_MOCK_DATA.copy()
         live_details['listing_timestamp'] = listing_timestamp
         
     log_messages = []
+    changed_fields = {}
+    profile_log_entries = []
     
     for field_name, new_value in updates.items():
         
@@ -506,9 +2328,10 @@ def update_profile_data():
             # --- END CRITICAL CHANGE ---
 
             live_details['amenities'] = new_value 
+            changed_fields['amenities'] = new_value
             
             log_messages.append(f"Updated amenities list. (Names: '{old_amenities_names}' -> '{new_amenities_names}')")
-            log_profile_change(listing_timestamp, section, field_name, old_amenities_names, new_amenities_names, editor_username)
+            profile_log_entries.append(profile_log_entry(listing_timestamp, section, field_name, old_amenities_names, new_amenities_names, editor_username))
             continue
             
         # Standard field update logic (Unchanged)
@@ -524,18 +2347,49 @@ def update_profile_data():
         
         if str(old_value) != str(new_value):
             current_data_source[field_name] = new_value
+            changed_fields[field_name] = new_value
             log_messages.append(f"Updated {field_name}: '{old_value}' -> '{new_value}'")
-            log_profile_change(listing_timestamp, section, field_name, old_value, new_value, editor_username)
+            profile_log_entries.append(profile_log_entry(listing_timestamp, section, field_name, old_value, new_value, editor_username))
+
+    if 'location' in changed_fields and 'latitude' not in updates and 'longitude' not in updates:
+        fill_listing_coordinates(core_listing)
+        changed_fields['latitude'], changed_fields['longitude'] = core_listing['latitude'], core_listing['longitude']
+
+    # 3. Journal the save first, so a crash part-way through the file writes below is rolled forward on restart
+    core_changes = {field: core_listing[field] for field in changed_fields if field in LISTING_FIELD_NAMES}
+    live_changes = {field: value for field, value in changed_fields.items() if field not in core_changes}
+    journal_id = journal_profile_save(listing_timestamp, core_changes, live_changes, live_details, profile_log_entries)
+    if journal_id is None:
+        return jsonify({"success": False, "message": "Server error while saving updated data. Nothing was changed."}), 500
 
-    # 3. Save ALL updated data
+    # 4. Save ALL updated data
+    search_stamps = _search_source_stamps()
     success_core = update_all_listings(all_listings)
     all_live_details[listing_timestamp] = live_details
     success_live = update_all_live_details(all_live_details)
 
     if success_core and success_live:
+        logged = append_profile_log_entries(profile_log_entries)
+        if not logged:
+            # The data is saved; the commit keeps the rows in the journal until recovery appends them
+            print(f"Warning: Failed to append profile log for {listing_timestamp}")
+        commit_profile_save(journal_id, logged)
         log_action('PROFILE_EDITED', editor_username, f"Edited profile for {core_listing['property_name']} (TS: {listing_timestamp}). Changes: {len(log_messages)}")
+        if changed_fields:
+            reindex_listings([(core_listing, live_details)], search_stamps)
+            publish_listing_change('profile_updated', listing_timestamp, core_listing.get('builder_username'), changed_fields)
         return jsonify({"success": True, "message": "Profile data updated and changes logged.", "changes": log_messages})
     else:
+        # Undo whichever file did get written, then abort the entry so it is never replayed. If the rollback
+        # fails too, the entry stays open and the next data_write_lock holder completes the save instead.
+        core_listing.clear()
+        core_listing.update(original_core_listing)
+        if original_live_details is None:
+            all_live_details.pop(listing_timestamp, None)
+        else:
+            all_live_details[listing_timestamp] = original_live_details
+        if update_all_listings(all_listings) and update_all_live_details(all_live_details):
+            abort_profile_save(journal_id)
         # Check which one failed for better logging
         error_message = f"Server error while saving updated data. Core save: {success_core}, Live save: {success_live}"
         return jsonify({"success": False, "message": error_message}), 500
@@ -543,6 +2397,7 @@ def update_profile_data():
 
 # --- Other API Routes (Unchanged) ---
 @app.route('/signup', methods=['POST'])
+@with_data_write_lock
 def signup():
     # ... (Unchanged)
     data = request.json
@@ -626,13 +2481,69 @@ def unified_login():
 def get_listings(username):
     # ... (Unchanged)
     all_listings = load_listings()
+    fields = requested_fields()
     builder_listings = [
-        listing for listing in all_listings
+        project_fields(listing, fields) for listing in all_listings
         if listing.get('builder_username') == username
     ]
     return jsonify({"success": True, "listings": builder_listings})
 
+@app.route('/search', methods=['GET'])
+def search_listings():
+    """Full-text search over listing names, location, unit type and profile text (?q=, ?limit=)."""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"success": False, "message": "Missing search query."}), 400
+    limit = max(1, min(request.args.get('limit', 20, type=int), SEARCH_MAX_RESULTS))
+    fields = requested_fields()
+    results = get_search_index().search(query, limit)
+    return jsonify({"success": True, "results": [project_fields(result, fields) for result in results]})
+
+@app.route('/search/suggest', methods=['GET'])
+def search_suggest():
+    """Autocompletes the last word of ?q= from the indexed vocabulary."""
+    words = request.args.get('q', '').split()
+    if not words:
+        return jsonify({"success": True, "suggestions": []})
+    limit = max(1, min(request.args.get('limit', 10, type=int), SEARCH_MAX_RESULTS))
+    return jsonify({"success": True, "suggestions": get_search_index().suggest(words[-1], limit)})
+
+@app.route('/listings_near', methods=['GET'])
+def listings_near():
+    """
+    Proximity search over geocoded listings. Either ?lat=&lon=[&radius_km=] for listings
+    within a radius (nearest first, with distance_km), or ?min_lat=&min_lon=&max_lat=&max_lon=
+    for a bounding box.
+    """
+    limit = max(1, min(request.args.get('limit', 50, type=int), SEARCH_MAX_RESULTS))
+    fields = requested_fields()
+    bbox = [request.args.get(key, type=float) for key in ('min_lat', 'min_lon', 'max_lat', 'max_lon')]
+
+    if all(value is not None for value in bbox):
+        if not all(math.isfinite(value) for value in bbox):
+            return jsonify({"success": False, "message": "Bounding box values must be finite numbers."}), 400
+        # Clamp to the globe so an oversized box cannot walk a huge range of grid cells
+        min_lat, max_lat = (min(max(value, -90.0), 90.0) for value in bbox[0::2])
+        min_lon, max_lon = (min(max(value, -180.0), 180.0) for value in bbox[1::2])
+        if min_lat > max_lat or min_lon > max_lon:
+            return jsonify({"success": False, "message": "Bounding box minimums must not exceed maximums."}), 400
+        listings = get_geo_index().within_bbox(min_lat, min_lon, max_lat, max_lon)[:limit]
+        return jsonify({"success": True, "listings": [project_fields(listing, fields) for listing in listings]})
+
+    latitude = request.args.get('lat', type=float)
+    longitude = request.args.get('lon', type=float)
+    radius_km = request.args.get('radius_km', GEO_DEFAULT_RADIUS_KM, type=float)
+    if latitude is None or longitude is None:
+        return jsonify({"success": False, "message": "Provide lat and lon, or min_lat, min_lon, max_lat and max_lon."}), 400
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180) or not (0 < radius_km <= GEO_MAX_RADIUS_KM):
+        return jsonify({"success": False, "message": f"Coordinates out of range or radius_km not in (0, {GEO_MAX_RADIUS_KM}]."}), 400
+
+    hits = get_geo_index().within_radius(latitude, longitude, radius_km)[:limit]
+    listings = [project_fields(dict(listing, distance_km=round(distance, 3)), fields) for distance, listing in hits]
+    return jsonify({"success": True, "listings": listings})
+
 @app.route('/delete_listing', methods=['POST'])
+@with_data_write_lock
 def delete_listing():
     # ... (Unchanged)
     data = request.get_json()
@@ -647,11 +2558,15 @@ def delete_listing():
         if listing.get('created_timestamp') == original_timestamp and listing.get('builder_username') == builder_username:
             property_name = listing.get('property_name', 'N/A')
             listing['status'] = 'Deleted'
+            deleted_listing = listing
             found = True
             break
     if found:
+        search_stamps = _search_source_stamps()
         if update_all_listings(listings):
             log_action('LISTING_DELETED', builder_username, f"Soft-deleted listing: {property_name} (TS: {original_timestamp})")
+            reindex_listings([(deleted_listing, None)], search_stamps)
+            publish_listing_change('deleted', original_timestamp, builder_username, {'status': 'Deleted'})
             return jsonify({"success": True, "message": "Listing status updated to 'Deleted'."})
         else:
             return jsonify({"success": False, "message": "Server error while saving status update."}), 500
@@ -660,8 +2575,8 @@ def delete_listing():
 
 @app.route('/get_profile_log/<listing_timestamp>', methods=['GET'])
 def get_profile_log(listing_timestamp):
-    # ... (Unchanged)
     logs = []
+    fields = requested_fields()
     try:
         with open(PROFILE_LOG_FILE, 'r', newline='', encoding='utf-8') as f:
             reader = csv.DictReader(f, fieldnames=PROFILE_LOG_FIELD_NAMES)
@@ -672,7 +2587,7 @@ def get_profile_log(listing_timestamp):
                 
             for row in reader:
                 if row.get('listing_timestamp') == listing_timestamp:
-                    logs.append(row)
+                    logs.append(project_fields(row, fields))
         logs.reverse() 
         return jsonify({"success": True, "logs": logs})
     except FileNotFoundError:
@@ -706,11 +2621,10 @@ def upload_media():
     if 'files' not in request.files or len(request.files.getlist('files')) == 0:
         return jsonify({"success": False, "message": "No files selected for upload."}), 400
     
-    # **FIX:** Replace colons with hyphens for Windows compatibility
-    safe_timestamp = listing_timestamp.replace(':', '-')
+    safe_timestamp = media_dir_name(listing_timestamp)
     
     # Create media directory for this listing if it doesn't exist
-    media_dir = os.path.join('media', safe_timestamp)
+    media_dir = os.path.join(MEDIA_DIR, safe_timestamp)
     os.makedirs(media_dir, exist_ok=True)
     
     uploaded_files = []
@@ -732,12 +2646,24 @@ def upload_media():
                 })
         
         if uploaded_files:
+            manifest_time = datetime.datetime.now().isoformat()
+            if not save_media_manifest_entries([
+                {'log_timestamp': manifest_time, 'media_dir': safe_timestamp, 'filename': f['filename'],
+                 'listing_timestamp': listing_timestamp, 'editor_username': editor_username}
+                for f in uploaded_files
+            ]):
+                return jsonify({"success": False, "message": "Server error while recording uploaded files."}), 500
+
             log_action('MEDIA_UPLOADED', editor_username, 
                       f"Uploaded {len(uploaded_files)} file(s) to listing {listing_timestamp}")
             log_profile_change(listing_timestamp, 'Media', 'files_uploaded', 
                              f"{len(uploaded_files)} file(s)", 
                              ', '.join([f['filename'] for f in uploaded_files]), 
                              editor_username)
+            owner = next((l for l in load_listings() if l.get('created_timestamp') == listing_timestamp), None)
+            builder_username = owner.get('builder_username') if owner else editor_username
+            publish_listing_change('media_uploaded', listing_timestamp, builder_username,
+                                   {'media': [f['url'] for f in uploaded_files]})
             
             return jsonify({
                 "success": True, 
@@ -757,7 +2683,7 @@ def upload_media():
 def serve_media(filepath):
     """Serve uploaded media files."""
     try:
-        return send_from_directory('media', filepath)
+        return send_from_directory(MEDIA_DIR, filepath)
     except Exception as e:
         print(f"Error serving media: {e}")
         return jsonify({"success": False, "message": "File not found."}), 404
@@ -765,6 +2691,7 @@ def serve_media(filepath):
 
 # --- NEW: Update User Profile ---
 @app.route('/update_user', methods=['POST'])
+@with_data_write_lock
 def update_user():
     """Update user profile information."""
     try:
@@ -816,10 +2743,13 @@ def update_user():
     except Exception as e:
         print(f"Error updating user: {e}")
         return jsonify({"success": False, "message": str(e)}), 500
+    finally:
+        _invalidate_cached(DATA_FILE)
 
 
 # --- NEW: Change Password ---
 @app.route('/change_password', methods=['POST'])
+@with_data_write_lock
 def change_password():
     """Change user password."""
     try:
@@ -870,6 +2800,8 @@ def change_password():
     except Exception as e:
         print(f"Error changing password: {e}")
         return jsonify({"success": False, "message": str(e)}), 500
+    finally:
+        _invalidate_cached(DATA_FILE)
 
 
 # --- Serve Static Files (HTML, CSS, JS, Images) ---